@@ -71,6 +71,20 @@ _C.TRAIN.CHECKPOINT_TYPE = "pytorch"
 # If True, perform inflation when loading checkpoint.
 _C.TRAIN.CHECKPOINT_INFLATE = False
 
+# Number of micro-batches to accumulate gradients over before stepping the
+# optimizer. DDP gradient sync is skipped on non-final micro-batches.
+_C.TRAIN.GRAD_ACCUM_STEPS = 1
+
+# If True, run the forward/backward pass in mixed precision (FP16 autocast
+# with gradient scaling).
+_C.TRAIN.MIXED_PRECISION = False
+
+# If True, compile the model with torch.compile for kernel fusion. The model
+# is recompiled whenever it is rebuilt (e.g. on multigrid long-cycle shape
+# changes). Ignored with MULTIGRID.SHORT_CYCLE, whose per-iteration batch
+# shape changes would thrash recompiles.
+_C.TRAIN.COMPILE = False
+
 
 # ---------------------------------------------------------------------------- #
 # Testing options
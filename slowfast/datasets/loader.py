@@ -52,6 +52,86 @@ def detection_collate(batch):
     return inputs, labels, video_idx, collated_extra_data
 
 
+def batch_to_cuda(batch):
+    """
+    Transfer a (inputs, labels, video_idx, meta) batch to the current GPU
+    device with non-blocking copies. video_idx is left on the CPU.
+    Args:
+        batch (tuple): batch as returned by the data loader.
+    Returns:
+        (tuple): the batch with inputs, labels and meta tensors on GPU.
+    """
+    inputs, labels, video_idx, meta = batch
+    # type() is marginally cheaper than isinstance() and the collate fns only
+    # ever produce plain lists here.
+    if type(inputs) is list:
+        inputs = [x.cuda(non_blocking=True) for x in inputs]
+    else:
+        inputs = inputs.cuda(non_blocking=True)
+    labels = labels.cuda(non_blocking=True)
+    for key, val in meta.items():
+        if type(val) is list:
+            meta[key] = [x.cuda(non_blocking=True) for x in val]
+        elif isinstance(val, torch.Tensor):
+            meta[key] = val.cuda(non_blocking=True)
+    return inputs, labels, video_idx, meta
+
+
+class CudaPrefetcher(object):
+    """
+    Wraps a data loader and copies batch i+1 to the GPU on a side CUDA stream
+    while batch i runs on the compute stream, hiding the H2D copy latency.
+    The loader should return pinned-memory batches (DATA_LOADER.PIN_MEMORY)
+    for the non-blocking copies to actually be asynchronous.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.stream = torch.cuda.Stream()
+        self._iter = None
+        self._next = None
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        self._iter = iter(self.loader)
+        self._preload()
+        return self
+
+    def _preload(self):
+        try:
+            batch = next(self._iter)
+        except StopIteration:
+            self._next = None
+            return
+        with torch.cuda.stream(self.stream):
+            self._next = batch_to_cuda(batch)
+
+    def _gpu_tensors(self, batch):
+        inputs, labels, _, meta = batch
+        tensors = list(inputs) if type(inputs) is list else [inputs]
+        tensors.append(labels)
+        for val in meta.values():
+            if type(val) is list:
+                tensors.extend(val)
+            elif isinstance(val, torch.Tensor):
+                tensors.append(val)
+        return [t for t in tensors if t.is_cuda]
+
+    def __next__(self):
+        batch = self._next
+        if batch is None:
+            raise StopIteration
+        # Make the compute stream wait for the copies, and keep the copied
+        # tensors owned by the compute stream for the caching allocator.
+        torch.cuda.current_stream().wait_stream(self.stream)
+        for tensor in self._gpu_tensors(batch):
+            tensor.record_stream(torch.cuda.current_stream())
+        self._preload()
+        return batch
+
+
 def construct_loader(cfg, split, is_precise_bn=False):
     """
     Constructs the data loader for the given dataset.
@@ -115,6 +195,20 @@ def construct_loader(cfg, split, is_precise_bn=False):
     return loader
 
 
+def get_sampler(loader):
+    """
+    Returns the sampler backing a loader, unwrapping a short-cycle batch
+    sampler if present. len() of the result is the per-rank sample count.
+    Args:
+        loader (loader): data loader to get the sampler from.
+    """
+    return (
+        loader.batch_sampler.sampler
+        if isinstance(loader.batch_sampler, ShortCycleBatchSampler)
+        else loader.sampler
+    )
+
+
 def shuffle_dataset(loader, cur_epoch):
     """"
     Shuffles the data.
@@ -122,11 +216,7 @@ def shuffle_dataset(loader, cur_epoch):
         loader (loader): data loader to perform shuffle.
         cur_epoch (int): number of the current epoch.
     """
-    sampler = (
-        loader.batch_sampler.sampler
-        if isinstance(loader.batch_sampler, ShortCycleBatchSampler)
-        else loader.sampler
-    )
+    sampler = get_sampler(loader)
     assert isinstance(
         sampler, (RandomSampler, DistributedSampler)
     ), "Sampler type '{}' not supported".format(type(sampler))
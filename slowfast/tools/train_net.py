@@ -2,12 +2,18 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved.
 
 """Train a video classification model."""
+import concurrent.futures
+import contextlib
 import os
 import numpy as np
 import pprint
 import torch
 import time
 from fvcore.nn.precise_bn import get_bn_modules, update_bn_stats
+import matplotlib
+# Headless backend so figures can be rendered off the main thread without a
+# GUI event loop.
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import torch.distributed as dist
 
@@ -19,33 +25,88 @@ import slowfast.utils.metrics as metrics
 import slowfast.utils.misc as misc
 import slowfast.visualization.tensorboard_vis as tb
 from slowfast.datasets import loader
+from slowfast.datasets.loader import CudaPrefetcher
 from slowfast.models import build_model
 from slowfast.utils.meters import AVAMeter, TrainMeter, ValMeter
 from slowfast.utils.multigrid import MultigridSchedule
 
 from common.utils.logger import CreateLogger
 
+
+def _unwrap_compiled(model):
+    """
+    Return the module underneath a torch.compile OptimizedModule (or the
+    model itself when not compiled) so checkpoint state dicts are written
+    and read without the _orig_mod key prefix.
+    """
+    return getattr(model, "_orig_mod", model)
+
+
 class Trainer(object):
     def __init__(self, cfg):
         self.logger = None
         self.cfg = cfg
+        # Side stream for device-to-host copies, created on first use.
+        self._copy_stream = None
+        # Single worker that renders matplotlib figures off the main thread.
+        self._plot_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1
+        )
+        # One-time environment reads used in the per-epoch log lines.
+        self._rankE = os.environ.get("RANK", None)
+        self._worldE = os.environ.get("WORLD_SIZE", None)
+        # Cached distributed state; refreshed once the process group is
+        # initialized (and again if the trainer is rebuilt).
+        self._is_master = du.is_master_proc()
+        self._rank = du.get_rank()
+        # Cache the plot clip limits once; plotStats runs on the hot path.
+        self._plot_max = {
+            k: float(v) for k, v in cfg.METRICS.PLOT_MAX_LIMITS.items()
+        }
+        self._plot_min = {
+            k: float(v) for k, v in cfg.METRICS.PLOT_MIN_LIMITS.items()
+        }
 
     def plotStats(self, stats, ite, typ):
-        if du.is_master_proc() and stats is not None:
+        if self._is_master and stats is not None:
+            inf = float("inf")
             for k, v in stats.items():
-                try:
-                    val = float(v)
-                    nme = "{}_{}".format(typ, k)
-                    maxx = self.cfg.METRICS.PLOT_MAX_LIMITS.get(k, None)
-                    val = min(val, maxx) if maxx is not None else val
-                    minn = self.cfg.METRICS.PLOT_MIN_LIMITS.get(k, None)
-                    val = max(val, minn) if minn is not None else val
-                    self.logger.log_row(name=nme, iter=ite, val=val, description="{} master proc".format(nme))
-                except ValueError:
-                    pass
+                # Some stats (e.g. the binary metrics) arrive as formatted
+                # strings; everything else non-numeric is skipped outright.
+                if isinstance(v, str):
+                    try:
+                        v = float(v)
+                    except ValueError:
+                        continue
+                elif not isinstance(v, (int, float, np.floating)):
+                    continue
+                val = max(
+                    self._plot_min.get(k, -inf),
+                    min(self._plot_max.get(k, inf), v),
+                )
+                nme = "{}_{}".format(typ, k)
+                self.logger.log_row(name=nme, iter=ite, val=val, description="{} master proc".format(nme))
+
+    def _gather_stacked(self, stacked):
+        """
+        All-gather a pre-sized 2xN preds/labels tensor from every rank into
+        one contiguous output tensor with a single collective. Rows stay
+        interleaved in rank order (preds, labels, preds, labels, ...).
+        """
+        world_size = du.get_world_size()
+        if world_size == 1:
+            return stacked
+        out = torch.empty(
+            (world_size * stacked.size(0), stacked.size(1)),
+            dtype=stacked.dtype,
+            device=stacked.device,
+        )
+        dist.all_gather_into_tensor(out, stacked.contiguous())
+        return out
 
     def train_epoch(
-        self, train_loader, model, optimizer, train_meter, cur_epoch, cfg, writer=None
+        self, train_loader, model, optimizer, train_meter, cur_epoch, cfg,
+        writer=None, scaler=None
     ):
         """
         Perform the video training for one epoch.
@@ -60,6 +121,8 @@ class Trainer(object):
                 slowfast/config/defaults.py
             writer (TensorboardWriter, optional): TensorboardWriter object
                 to writer Tensorboard log.
+            scaler (GradScaler, optional): gradient scaler for mixed precision
+                training.
         """
         # Enable train mode.
         model.train()
@@ -67,153 +130,273 @@ class Trainer(object):
         data_size = len(train_loader)
         start = time.time()
         btch = cfg.TRAIN.BATCH_SIZE * self.cfg.NUM_SHARDS
-        rankE = os.environ.get("RANK", None)
-        worldE = os.environ.get("WORLD_SIZE", None)
         dSize = data_size * btch
         self.logger.info("Train Epoch {} dLen {} Batch {} dSize {} localRank {} rank {} {} world {} {}".format(
-            cur_epoch, data_size, btch, dSize, du.get_local_rank(), du.get_rank(), rankE, du.get_world_size(), worldE))
+            cur_epoch, data_size, btch, dSize, du.get_local_rank(), du.get_rank(), self._rankE, du.get_world_size(), self._worldE))
         tot = 0
         first = True
         predsAll = []
         labelsAll = []
+        log_period = cfg.LOG_PERIOD
+        accum_steps = cfg.TRAIN.GRAD_ACCUM_STEPS
+        # Use the rank info cached on the trainer; no distributed queries
+        # inside the loop.
+        is_master = self._is_master
+        if scaler is None:
+            scaler = torch.cuda.amp.GradScaler(enabled=cfg.TRAIN.MIXED_PRECISION)
+        # Explicitly declare reduction to mean.
+        loss_fun = losses.get_loss_func(cfg.MODEL.LOSS_FUNC)(reduction="mean")
+        # Precompute the lr for every iteration of the epoch; the optimizer
+        # param groups are only touched when the value actually changes.
+        lrs = [
+            optim.get_epoch_lr(cur_epoch + float(i) / data_size, cfg)
+            for i in range(data_size)
+        ]
+        last_lr = None
+        # Keep running stats on GPU and only read them back (a sync point)
+        # once per log period instead of every iteration.
+        loss_accum = torch.zeros([], device="cuda")
+        top1_accum = torch.zeros([], device="cuda")
+        top5_accum = torch.zeros([], device="cuda")
+        accum_iters = 0
+        # Binary classifier - accumulate preds / labels in GPU buffers; they
+        # are copied to the host only at log boundaries. Allocated on the
+        # first batch so the labels buffer keeps the incoming label dtype.
+        use_preds_buf = (
+            cfg.MODEL.NUM_CLASSES == 2
+            and not cfg.DATA.MULTI_LABEL
+            and not cfg.DETECTION.ENABLE
+        )
+        preds_buf = labels_buf = None
+        preds_idx = 0
+
+        # Double-buffer the input pipeline: batch i+1 is copied H2D on a side
+        # stream while batch i runs on the compute stream.
+        prefetcher = CudaPrefetcher(train_loader)
 
-        for cur_iter, (inputs, labels, _, meta) in enumerate(train_loader):
-            # Transfer the data to the current GPU device.
+        for cur_iter, (inputs, labels, _, meta) in enumerate(prefetcher):
+            # The data is already on the current GPU device.
             tot += len(labels)
-            if isinstance(inputs, (list,)):
-                if first:
-                    self.logger.info("rank {} LEN {}  {} shape Slow {} Fast {} {} tot {}".format(du.get_rank(), len(labels), len(inputs), 
+            if first:
+                if isinstance(inputs, (list,)):
+                    self.logger.info("rank {} LEN {}  {} shape Slow {} Fast {} {} tot {}".format(du.get_rank(), len(labels), len(inputs),
                         inputs[0].shape, inputs[1].shape, labels[0].shape, tot))
-                    first = False
-                for i in range(len(inputs)):
-                    inputs[i] = inputs[i].cuda(non_blocking=True)
-            else:
-                if first:
-                    self.logger.info("rank {} LEN {} shape {} {} tot {}".format(du.get_rank(), len(labels),  
-                        inputs.shape, labels[0].shape, tot))
-                    first = False
-                inputs = inputs.cuda(non_blocking=True)
-            labels = labels.cuda()
-            
-            for key, val in meta.items():
-                if isinstance(val, (list,)):
-                    for i in range(len(val)):
-                        val[i] = val[i].cuda(non_blocking=True)
                 else:
-                    meta[key] = val.cuda(non_blocking=True)
+                    self.logger.info("rank {} LEN {} shape {} {} tot {}".format(du.get_rank(), len(labels),
+                        inputs.shape, labels[0].shape, tot))
+                first = False
 
             # Update the learning rate.
-            lr = optim.get_epoch_lr(cur_epoch + float(cur_iter) / data_size, cfg)
-            optim.set_lr(optimizer, lr)
-            if cfg.DETECTION.ENABLE:
-                # Compute the predictions.
-                preds = model(inputs, meta["boxes"])
-
-            else:
-                # Perform the forward pass.
-                preds = model(inputs)
-            # Explicitly declare reduction to mean.
-            loss_fun = losses.get_loss_func(cfg.MODEL.LOSS_FUNC)(reduction="mean")
+            lr = lrs[cur_iter]
+            if lr != last_lr:
+                optim.set_lr(optimizer, lr)
+                last_lr = lr
+            # Skip the DDP gradient all-reduce on non-final micro-batches when
+            # accumulating gradients. The forward pass has to run inside
+            # no_sync() as well, otherwise DDP still prepares for a reduction.
+            is_accum_boundary = (
+                (cur_iter + 1) % accum_steps == 0 or (cur_iter + 1) == data_size
+            )
+            is_log_boundary = (
+                (cur_iter + 1) % log_period == 0 or (cur_iter + 1) == data_size
+            )
+            sync_ctx = (
+                model.no_sync()
+                if cfg.NUM_GPUS > 1 and not is_accum_boundary
+                else contextlib.nullcontext()
+            )
+            with sync_ctx:
+                with torch.cuda.amp.autocast(enabled=cfg.TRAIN.MIXED_PRECISION):
+                    if cfg.DETECTION.ENABLE:
+                        # Compute the predictions.
+                        preds = model(inputs, meta["boxes"])
 
-            # Compute the loss.
-            loss = loss_fun(preds, labels)
+                    else:
+                        # Perform the forward pass.
+                        preds = model(inputs)
 
-            # check Nan Loss.
-            misc.check_nan_losses(loss)
+                    # Compute the loss.
+                    loss = loss_fun(preds, labels)
 
-            # Perform the backward pass.
-            optimizer.zero_grad()
-            loss.backward()
-            # Update the parameters.
-            optimizer.step()
+                # Perform the backward pass. The loss is scaled for the
+                # backward only; stats report the unscaled loss.
+                if accum_steps > 1:
+                    scaler.scale(loss / accum_steps).backward()
+                else:
+                    scaler.scale(loss).backward()
+            if is_accum_boundary:
+                # Update the parameters.
+                scaler.step(optimizer)
+                scaler.update()
+                # Drop the grads instead of zeroing them; skips a memset
+                # kernel per parameter tensor.
+                optimizer.zero_grad(set_to_none=True)
 
             if cfg.DETECTION.ENABLE:
-                if cfg.NUM_GPUS > 1:
-                    loss = du.all_reduce([loss])[0]
-                loss = loss.item()
+                loss_accum += loss.detach()
+                accum_iters += 1
 
                 train_meter.iter_toc()
-                # Update and log stats.
-                train_meter.update_stats(None, None, None, loss, lr)
-                # write to tensorboard format if available.
-                if writer is not None:
-                    writer.add_scalars(
-                        {"Train/loss": loss, "Train/lr": lr},
-                        global_step=data_size * cur_epoch + cur_iter,
-                    )
-                ite = data_size * cur_epoch + cur_iter
-                if du.is_master_proc():
-                    self.logger.log_row(name='TrainLoss', iter=ite, loss=loss, description="train loss")
-                    self.logger.log_row(name='TrainLr', iter=ite, lr=lr, description="train learn rate")
+                if is_log_boundary:
+                    if cfg.NUM_GPUS > 1:
+                        loss_accum = du.all_reduce([loss_accum])[0]
+                    # Copy the stats from GPU to CPU (sync point).
+                    loss = (loss_accum / accum_iters).item()
+                    # check Nan Loss.
+                    misc.check_nan_losses(loss)
+                    # Update and log stats.
+                    train_meter.update_stats(None, None, None, loss, lr)
+                    # write to tensorboard format if available.
+                    if writer is not None:
+                        writer.add_scalars(
+                            {"Train/loss": loss, "Train/lr": lr},
+                            global_step=data_size * cur_epoch + cur_iter,
+                        )
+                    ite = data_size * cur_epoch + cur_iter
+                    if is_master:
+                        self.logger.log_row(name='TrainLoss', iter=ite, loss=loss, description="train loss")
+                        self.logger.log_row(name='TrainLr', iter=ite, lr=lr, description="train learn rate")
+                    loss_accum.zero_()
+                    accum_iters = 0
 
             else:
                 top1_err, top5_err = None, None
                 if cfg.DATA.MULTI_LABEL:
-                    # Gather all the predictions across all the devices.
-                    if cfg.NUM_GPUS > 1:
-                        [loss] = du.all_reduce([loss])
-                    loss = loss.item()
+                    loss_accum += loss.detach()
+                    accum_iters += 1
                 else:
                     # Binary classifier - save preds / labels for metrics
+                    if use_preds_buf:
+                        if preds_buf is None:
+                            # Upper bound on the samples this rank consumes
+                            # in one epoch; short-cycle multigrid varies the
+                            # batch size per iteration, so size from the
+                            # sampler rather than the base batch size.
+                            buf_size = len(loader.get_sampler(train_loader))
+                            preds_buf = torch.empty(buf_size, device="cuda")
+                            labels_buf = torch.empty(
+                                buf_size, dtype=labels.dtype, device="cuda"
+                            )
+                        n = labels.size(0)
+                        preds_buf[preds_idx : preds_idx + n].copy_(preds[:, -1].detach())
+                        labels_buf[preds_idx : preds_idx + n].copy_(labels.detach())
+                        preds_idx += n
+                    # Compute the errors. The results stay on GPU until the
+                    # periodic read below. Cast preds to FP32 in case the
+                    # forward ran under autocast.
                     if cfg.MODEL.NUM_CLASSES == 2:
-                        predsAll.extend(preds.detach().cpu().numpy()[:,-1])
-                        labelsAll.extend(labels.detach().cpu().numpy())
-                    # Compute the errors.
-                    num_topks_correct = metrics.topks_correct(preds, labels, (1, min(5, cfg.MODEL.NUM_CLASSES)))
-                    top1_err, top5_err = [
-                        (1.0 - x / preds.size(0)) * 100.0 for x in num_topks_correct
-                    ]
+                        # Binary case: top-1 is just argmax == label and top-5
+                        # is trivially all-correct, so skip topks_correct.
+                        top1_correct = (preds.argmax(1) == labels).sum()
+                        num_topks_correct = (
+                            top1_correct,
+                            torch.full_like(top1_correct, preds.size(0)),
+                        )
+                    else:
+                        num_topks_correct = metrics.topks_correct(preds.float(), labels, (1, min(5, cfg.MODEL.NUM_CLASSES)))
+                    loss_accum += loss.detach()
+                    top1_accum += (1.0 - num_topks_correct[0] / preds.size(0)) * 100.0
+                    top5_accum += (1.0 - num_topks_correct[1] / preds.size(0)) * 100.0
+                    accum_iters += 1
 
-                    # Gather all the predictions across all the devices.
+                train_meter.iter_toc()
+                if is_log_boundary:
+                    # Gather all the stats across all the devices.
                     if cfg.NUM_GPUS > 1:
-                        loss, top1_err, top5_err = du.all_reduce(
-                            [loss, top1_err, top5_err]
-                        )
+                        if cfg.DATA.MULTI_LABEL:
+                            [loss_accum] = du.all_reduce([loss_accum])
+                        else:
+                            # Fuse the three tiny reductions into one NCCL
+                            # launch; the collective is latency bound.
+                            stats_buf = torch.stack(
+                                [loss_accum, top1_accum, top5_accum]
+                            )
+                            dist.all_reduce(stats_buf, op=dist.ReduceOp.SUM)
+                            stats_buf.mul_(1.0 / du.get_world_size())
+                            loss_accum, top1_accum, top5_accum = stats_buf.unbind()
 
                     # Copy the stats from GPU to CPU (sync point).
-                    loss, top1_err, top5_err = (
-                        loss.item(),
-                        top1_err.item(),
-                        top5_err.item(),
-                    )
+                    loss = (loss_accum / accum_iters).item()
+                    # check Nan Loss.
+                    misc.check_nan_losses(loss)
+                    if not cfg.DATA.MULTI_LABEL:
+                        top1_err = (top1_accum / accum_iters).item()
+                        top5_err = (top5_accum / accum_iters).item()
 
-                train_meter.iter_toc()
-                # Update and log stats.
-                # self.logger.info("UPDATING stat {} {} {}".format(inputs[0].size(0), cfg.NUM_GPUS, inputs[0].size(0) * cfg.NUM_GPUS))
-                train_meter.update_stats(
-                    top1_err, top5_err, loss, lr, inputs[0].size(0) * cfg.NUM_GPUS
-                )
-                # write to tensorboard format if available.
-                if writer is not None:
-                    writer.add_scalars(
-                        {
-                            "Train/loss": loss,
-                            "Train/lr": lr,
-                            "Train/Top1_err": top1_err,
-                            "Train/Top5_err": top5_err,
-                        },
-                        global_step=data_size * cur_epoch + cur_iter,
+                    # Update and log stats.
+                    # self.logger.info("UPDATING stat {} {} {}".format(inputs[0].size(0), cfg.NUM_GPUS, inputs[0].size(0) * cfg.NUM_GPUS))
+                    train_meter.update_stats(
+                        top1_err, top5_err, loss, lr,
+                        inputs[0].size(0) * cfg.NUM_GPUS * accum_iters
                     )
-
-            stats = train_meter.log_iter_stats(cur_epoch, cur_iter, predsAll, labelsAll)
-            ite = dSize * cur_epoch + btch * (cur_iter+1)
-            self.plotStats(stats, ite, 'TrainIter')
+                    # write to tensorboard format if available.
+                    if writer is not None:
+                        writer.add_scalars(
+                            {
+                                "Train/loss": loss,
+                                "Train/lr": lr,
+                                "Train/Top1_err": top1_err,
+                                "Train/Top5_err": top5_err,
+                            },
+                            global_step=data_size * cur_epoch + cur_iter,
+                        )
+                    loss_accum.zero_()
+                    top1_accum.zero_()
+                    top5_accum.zero_()
+                    accum_iters = 0
+
+            # Iteration logging only does work on the master rank at log
+            # boundaries; skip the Python metric walk everywhere else.
+            if is_master and is_log_boundary:
+                if preds_idx > 0:
+                    # One host read of the accumulated preds / labels per period.
+                    predsAll = preds_buf[:preds_idx].cpu().numpy()
+                    labelsAll = labels_buf[:preds_idx].cpu().numpy()
+                stats = train_meter.log_iter_stats(cur_epoch, cur_iter, predsAll, labelsAll)
+                ite = dSize * cur_epoch + btch * (cur_iter+1)
+                self.plotStats(stats, ite, 'TrainIter')
             train_meter.iter_tic()
 
-        if du.is_master_proc() and cfg.LOG_MODEL_INFO:
+        end = time.time()
+        el = end - start
+        # Launch the sample-count and elapsed-time reductions asynchronously
+        # so they overlap with the preds/labels gather below instead of
+        # serializing three collectives.
+        tot_t = torch.tensor(tot).cuda()
+        elT = torch.tensor(el).cuda()
+        tot_work = el_work = None
+        if du.get_world_size() > 1:
+            tot_work = dist.all_reduce(tot_t, op=dist.ReduceOp.SUM, async_op=True)
+            el_work = dist.all_reduce(elT, op=dist.ReduceOp.MAX, async_op=True)
+
+        if self._is_master and cfg.LOG_MODEL_INFO:
             misc.log_model_info(model, cfg, use_train_input=True)
-        # Log epoch stats.
-        gathered = du.all_gather([torch.tensor(predsAll).to(torch.device("cuda")), torch.tensor(labelsAll).to(torch.device("cuda"))])
-        stats = train_meter.log_epoch_stats(cur_epoch, gathered[0].detach().cpu().numpy(), gathered[1].detach().cpu().numpy())
+        # Log epoch stats. Stack preds / labels into one 2xN tensor so the
+        # epoch-end gather is a single collective instead of two; the buffers
+        # already live on GPU so no re-upload is needed.
+        if preds_buf is not None:
+            # Cast labels up to the preds dtype for the fused collective.
+            stacked = torch.stack(
+                [preds_buf[:preds_idx], labels_buf[:preds_idx].to(preds_buf.dtype)]
+            )
+        else:
+            stacked = torch.zeros(2, 0, device="cuda")
+        gathered = self._gather_stacked(stacked)
+        # Only the master rank pays for the D2H copy of the full epoch.
+        if self._is_master:
+            predsG = gathered[0::2].reshape(-1).cpu().numpy()
+            labelsG = gathered[1::2].reshape(-1).cpu().numpy()
+        else:
+            predsG, labelsG = [], []
+        stats = train_meter.log_epoch_stats(cur_epoch, predsG, labelsG)
         ite = (cur_epoch+1) * dSize
         self.plotStats(stats, ite, 'TrainEpoch')
         train_meter.reset()
-        end = time.time()
-        el = end - start
-        totAll = du.all_reduce([torch.tensor(tot).cuda()], average=False)
-        tSum = totAll[0].item()
-        elT = torch.tensor(el).cuda()
-        elMax = du.all_reduce([elT], op=dist.ReduceOp.MAX, average=False)[0].item()
+        if tot_work is not None:
+            tot_work.wait()
+            el_work.wait()
+        tSum = tot_t.item()
+        elMax = elT.item()
         jobRate = tSum/elMax
         self.logger.info("totSampCnt {} workerSampCnt {}  eTimeMax {} eTimeWorker {}  SampPerSecJob {:.1f} SampPerSecWorker {:.1f}".format(
             tSum, tot, elMax, el, jobRate, tot/el))
@@ -238,39 +421,50 @@ class Trainer(object):
         model.eval()
         data_size = len(val_loader)
         btch = cfg.TRAIN.BATCH_SIZE * self.cfg.NUM_SHARDS
-        rankE = os.environ.get("RANK", None)
-        worldE = os.environ.get("WORLD_SIZE", None)
         dSize = data_size * btch
+        # Global-step base for the per-iteration writer / log_row calls.
+        dse = data_size * cur_epoch
         self.logger.info("Val Epoch {} dLen {} Batch {} dSize {} localRank {} rank {} {} world {} {}".format(
-            cur_epoch, data_size, btch, dSize, du.get_local_rank(), du.get_rank(), rankE, du.get_world_size(), worldE))
+            cur_epoch, data_size, btch, dSize, du.get_local_rank(), du.get_rank(), self._rankE, du.get_world_size(), self._worldE))
 
         val_meter.iter_tic()
         predsAll = []
         labelsAll = []
-        data_size = len(val_loader)
+        log_period = cfg.LOG_PERIOD
+        # Use the rank info cached on the trainer; no distributed queries
+        # inside the loop.
+        is_master = self._is_master
+        # Binary classifier - accumulate preds / labels in GPU buffers; they
+        # are copied to the host only at log boundaries. Allocated on the
+        # first batch so the labels buffer keeps the incoming label dtype.
+        use_preds_buf = (
+            cfg.MODEL.NUM_CLASSES == 2
+            and not cfg.DATA.MULTI_LABEL
+            and not cfg.DETECTION.ENABLE
+        )
+        preds_buf = labels_buf = None
+        preds_idx = 0
 
-        for cur_iter, (inputs, labels, _, meta) in enumerate(val_loader):
-            # Transferthe data to the current GPU device.
-            if isinstance(inputs, (list,)):
-                for i in range(len(inputs)):
-                    inputs[i] = inputs[i].cuda(non_blocking=True)
-            else:
-                inputs = inputs.cuda(non_blocking=True)
-            labels = labels.cuda()
-            for key, val in meta.items():
-                if isinstance(val, (list,)):
-                    for i in range(len(val)):
-                        val[i] = val[i].cuda(non_blocking=True)
-                else:
-                    meta[key] = val.cuda(non_blocking=True)
+        # Double-buffer the input pipeline: batch i+1 is copied H2D on a side
+        # stream while batch i runs on the compute stream.
+        prefetcher = CudaPrefetcher(val_loader)
 
+        for cur_iter, (inputs, labels, _, meta) in enumerate(prefetcher):
+            # The data is already on the current GPU device.
             if cfg.DETECTION.ENABLE:
                 # Compute the predictions.
                 preds = model(inputs, meta["boxes"])
 
-                preds = preds.cpu()
-                ori_boxes = meta["ori_boxes"].cpu()
-                metadata = meta["metadata"].cpu()
+                # Issue the three D2H copies on a side stream so they can
+                # overlap, then sync once before the tensors are used.
+                if self._copy_stream is None:
+                    self._copy_stream = torch.cuda.Stream()
+                self._copy_stream.wait_stream(torch.cuda.current_stream())
+                with torch.cuda.stream(self._copy_stream):
+                    preds = preds.to("cpu", non_blocking=True)
+                    ori_boxes = meta["ori_boxes"].to("cpu", non_blocking=True)
+                    metadata = meta["metadata"].to("cpu", non_blocking=True)
+                self._copy_stream.synchronize()
 
                 if cfg.NUM_GPUS > 1:
                     preds = torch.cat(du.all_gather_unaligned(preds), dim=0)
@@ -278,8 +472,8 @@ class Trainer(object):
                     metadata = torch.cat(du.all_gather_unaligned(metadata), dim=0)
 
                 val_meter.iter_toc()
-                # Update and log stats.
-                val_meter.update_stats(preds.cpu(), ori_boxes.cpu(), metadata.cpu())
+                # Update and log stats. The tensors are already on the CPU.
+                val_meter.update_stats(preds, ori_boxes, metadata)
 
             else:
                 preds = model(inputs)
@@ -288,12 +482,33 @@ class Trainer(object):
                     if cfg.NUM_GPUS > 1:
                         preds, labels = du.all_gather([preds, labels])
                 else:
-                    if cfg.MODEL.NUM_CLASSES == 2:
-                        predsAll.extend(preds.detach().cpu().numpy()[:,-1])
-                        labelsAll.extend(labels.detach().cpu().numpy())
+                    if use_preds_buf:
+                        if preds_buf is None:
+                            # Upper bound on the samples this rank consumes
+                            # in one epoch; short-cycle multigrid varies the
+                            # batch size per iteration, so size from the
+                            # sampler rather than the base batch size.
+                            buf_size = len(loader.get_sampler(val_loader))
+                            preds_buf = torch.empty(buf_size, device="cuda")
+                            labels_buf = torch.empty(
+                                buf_size, dtype=labels.dtype, device="cuda"
+                            )
+                        n = labels.size(0)
+                        preds_buf[preds_idx : preds_idx + n].copy_(preds[:, -1].detach())
+                        labels_buf[preds_idx : preds_idx + n].copy_(labels.detach())
+                        preds_idx += n
 
                     # Compute the errors.
-                    num_topks_correct = metrics.topks_correct(preds, labels, (1, min(5, cfg.MODEL.NUM_CLASSES)))
+                    if cfg.MODEL.NUM_CLASSES == 2:
+                        # Binary case: top-1 is just argmax == label and top-5
+                        # is trivially all-correct, so skip topks_correct.
+                        top1_correct = (preds.argmax(1) == labels).sum()
+                        num_topks_correct = (
+                            top1_correct,
+                            torch.full_like(top1_correct, preds.size(0)),
+                        )
+                    else:
+                        num_topks_correct = metrics.topks_correct(preds, labels, (1, min(5, cfg.MODEL.NUM_CLASSES)))
 
                     # Combine the errors across the GPUs.
                     top1_err, top5_err = [
@@ -314,25 +529,47 @@ class Trainer(object):
                     if writer is not None:
                         writer.add_scalars(
                             {"Val/Top1_err": top1_err, "Val/Top5_err": top5_err},
-                            global_step=len(val_loader) * cur_epoch + cur_iter,
+                            global_step=dse + cur_iter,
                         )
 
-                    if du.is_master_proc():
-                        ite = len(val_loader) * cur_epoch + cur_iter
+                    if is_master:
+                        ite = dse + cur_iter
                         self.logger.log_row(name='ValTop1', iter=ite, lr=top1_err, description="Top 1 Err")
                         self.logger.log_row(name='ValTop5', iter=ite, lr=top5_err, description="Top 5 Err")
 
                 val_meter.update_predictions(preds, labels)
 
-            stats = val_meter.log_iter_stats(cur_epoch, cur_iter, predsAll, labelsAll)
-            ite = dSize * cur_epoch + btch * (cur_iter+1)
-            self.plotStats(stats, ite, 'ValIter')
+            # Iteration logging only does work on the master rank at log
+            # boundaries; skip the Python metric walk everywhere else.
+            if is_master and (cur_iter + 1) % log_period == 0:
+                if preds_idx > 0:
+                    # One host read of the accumulated preds / labels per period.
+                    predsAll = preds_buf[:preds_idx].cpu().numpy()
+                    labelsAll = labels_buf[:preds_idx].cpu().numpy()
+                stats = val_meter.log_iter_stats(cur_epoch, cur_iter, predsAll, labelsAll)
+                ite = dSize * cur_epoch + btch * (cur_iter+1)
+                self.plotStats(stats, ite, 'ValIter')
 
             val_meter.iter_tic()
 
-        # Log epoch stats.
-        gathered = du.all_gather([torch.tensor(predsAll).to(torch.device("cuda")), torch.tensor(labelsAll).to(torch.device("cuda"))])
-        stats = val_meter.log_epoch_stats(cur_epoch, gathered[0].detach().cpu().numpy(), gathered[1].detach().cpu().numpy())
+        # Log epoch stats. Stack preds / labels into one 2xN tensor so the
+        # epoch-end gather is a single collective instead of two; the buffers
+        # already live on GPU so no re-upload is needed.
+        if preds_buf is not None:
+            # Cast labels up to the preds dtype for the fused collective.
+            stacked = torch.stack(
+                [preds_buf[:preds_idx], labels_buf[:preds_idx].to(preds_buf.dtype)]
+            )
+        else:
+            stacked = torch.zeros(2, 0, device="cuda")
+        gathered = self._gather_stacked(stacked)
+        # Only the master rank pays for the D2H copy of the full epoch.
+        if self._is_master:
+            predsG = gathered[0::2].reshape(-1).cpu().numpy()
+            labelsG = gathered[1::2].reshape(-1).cpu().numpy()
+        else:
+            predsG, labelsG = [], []
+        stats = val_meter.log_epoch_stats(cur_epoch, predsG, labelsG)
         ite = (cur_epoch+1) * dSize
         self.plotStats(stats, ite, 'ValEpoch')
 
@@ -342,13 +579,13 @@ class Trainer(object):
                 writer.add_scalars(
                     {"Val/mAP": val_meter.full_map}, global_step=cur_epoch
                 )
-            all_preds_cpu = [
-                pred.clone().detach().cpu() for pred in val_meter.all_preds
-            ]
-            all_labels_cpu = [
-                label.clone().detach().cpu() for label in val_meter.all_labels
-            ]
-            # plotScatter(all_preds_cpu, all_labels_cpu, "Epoch_{}".format(cur_epoch))
+            # One contiguous D2H copy instead of a sync per stored batch.
+            if len(val_meter.all_preds) > 0:
+                all_preds_cpu = torch.cat(val_meter.all_preds, dim=0).cpu()
+                all_labels_cpu = torch.cat(val_meter.all_labels, dim=0).cpu()
+            else:
+                all_preds_cpu, all_labels_cpu = [], []
+            # plotScatterAsync(all_preds_cpu, all_labels_cpu, "Epoch_{}".format(cur_epoch))
             # writer.plot_eval(
             #     preds=all_preds_cpu, labels=all_labels_cpu, global_step=cur_epoch
             # )
@@ -360,11 +597,19 @@ class Trainer(object):
         ax.plot(preds, labels, 'o', markersize=5)
         plt.gca().set_aspect('equal', adjustable='box')
         plt.grid(True)
-        plt.title('{} '.format(prefix, db_name, r_p))
+        plt.title('{} '.format(prefix))
         plt.ylabel('labels')
         plt.xlabel('Predictions')
         self.logger.log_image(prefix, plot=fig)
 
+    def plotScatterAsync(self, preds, labels, prefix):
+        """
+        Submit plotScatter to the background plot worker so the matplotlib
+        rendering does not stall the training thread. preds / labels must
+        already be detached CPU data (numpy or lists), never CUDA tensors.
+        """
+        self._plot_executor.submit(self.plotScatter, preds, labels, prefix)
+
     def calculate_and_update_precise_bn(self, loader, model, num_iters=200):
         """
         Update the stats in bn layers by calculate the precise stats.
@@ -375,12 +620,9 @@ class Trainer(object):
         """
 
         def _gen_loader():
-            for inputs, _, _, _ in loader:
-                if isinstance(inputs, (list,)):
-                    for i in range(len(inputs)):
-                        inputs[i] = inputs[i].cuda(non_blocking=True)
-                else:
-                    inputs = inputs.cuda(non_blocking=True)
+            # Reuse the stream prefetcher from the training loop; it owns the
+            # list-vs-tensor transfer dispatch.
+            for inputs, _, _, _ in CudaPrefetcher(loader):
                 yield inputs
 
         # Update the bn stats.
@@ -404,10 +646,22 @@ class Trainer(object):
             train_meter (TrainMeter): tool for measuring training stats.
             val_meter (ValMeter): tool for measuring validation stats.
         """
+        # Refresh the cached rank info; the world may have changed across a
+        # multigrid transition.
+        self._is_master = du.is_master_proc()
+        self._rank = du.get_rank()
+
         # Build the video model and print model statistics.
         model = build_model(cfg)
-        if du.is_master_proc() and cfg.LOG_MODEL_INFO:
+        if self._is_master and cfg.LOG_MODEL_INFO:
             misc.log_model_info(model, cfg, use_train_input=True)
+        if cfg.TRAIN.COMPILE and not cfg.MULTIGRID.SHORT_CYCLE:
+            # Input shapes are static between multigrid long-cycle
+            # transitions, so the compiled graphs stay valid until the model
+            # is rebuilt here. Short-cycle multigrid changes the batch shape
+            # every iteration and would thrash recompiles with dynamic=False,
+            # so it is excluded.
+            model = torch.compile(model, mode="reduce-overhead", dynamic=False)
 
         # Construct the optimizer.
         optimizer = optim.construct_optimizer(model, cfg)
@@ -442,6 +696,9 @@ class Trainer(object):
         """
         # Set up environment.
         du.init_distributed_training(cfg)
+        # Refresh the cached rank info now that the process group is up.
+        self._is_master = du.is_master_proc()
+        self._rank = du.get_rank()
         # Set random seed from configs.
         np.random.seed(cfg.RNG_SEED)
         torch.manual_seed(cfg.RNG_SEED)
@@ -462,14 +719,26 @@ class Trainer(object):
 
         # Build the video model and print model statistics.
         model = build_model(cfg)
-        if du.is_master_proc() and cfg.LOG_MODEL_INFO:
+        if self._is_master and cfg.LOG_MODEL_INFO:
             misc.log_model_info(model, cfg, use_train_input=True)
+        if cfg.TRAIN.COMPILE and not cfg.MULTIGRID.SHORT_CYCLE:
+            # Input shapes are static between multigrid long-cycle
+            # transitions, so the compiled graphs stay valid until the model
+            # is rebuilt. Short-cycle multigrid changes the batch shape every
+            # iteration and would thrash recompiles with dynamic=False, so it
+            # is excluded.
+            model = torch.compile(model, mode="reduce-overhead", dynamic=False)
 
         # Construct the optimizer.
         optimizer = optim.construct_optimizer(model, cfg)
 
+        # Gradient scaler for mixed precision training.
+        scaler = torch.cuda.amp.GradScaler(enabled=cfg.TRAIN.MIXED_PRECISION)
+
         # Load a checkpoint to resume training if applicable.
-        start_epoch = cu.load_train_checkpoint(cfg, model, optimizer, self.logger)
+        start_epoch = cu.load_train_checkpoint(
+            cfg, _unwrap_compiled(model), optimizer, self.logger
+        )
 
         # Create the video train and val loaders.
         train_loader = loader.construct_loader(cfg, "train")
@@ -521,14 +790,18 @@ class Trainer(object):
                         last_checkpoint = cfg.TRAIN.CHECKPOINT_FILE_PATH
                     self.logger.info("Load from {}".format(last_checkpoint))
                     cu.load_checkpoint(
-                        last_checkpoint, model, cfg.NUM_GPUS > 1, optimizer
+                        last_checkpoint,
+                        _unwrap_compiled(model),
+                        cfg.NUM_GPUS > 1,
+                        optimizer,
                     )
 
             # Shuffle the dataset.
             loader.shuffle_dataset(train_loader, cur_epoch)
             # Train for one epoch.
             avgRate += self.train_epoch(
-                train_loader, model, optimizer, train_meter, cur_epoch, cfg, writer
+                train_loader, model, optimizer, train_meter, cur_epoch, cfg,
+                writer, scaler
             )
             epCnt += 1
 
@@ -545,7 +818,9 @@ class Trainer(object):
             if cu.is_checkpoint_epoch(
                 cfg, cur_epoch, None if multigrid is None else multigrid.schedule
             ):
-                chkFile = cu.save_checkpoint(cfg.OUTPUT_DIR, model, optimizer, cur_epoch, cfg)
+                chkFile = cu.save_checkpoint(
+                    cfg.OUTPUT_DIR, _unwrap_compiled(model), optimizer, cur_epoch, cfg
+                )
                 self.logger.info("Created checkpont {}".format(chkFile))
             # Evaluate the model on validation set.
             if misc.is_eval_epoch(
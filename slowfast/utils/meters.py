@@ -667,8 +667,10 @@ class ValMeter(object):
             labels (tensor): labels.
         """
         # TODO: merge update_prediction with update_stats.
-        self.all_preds.append(preds)
-        self.all_labels.append(labels)
+        # Keep the tensors on GPU; they are moved to the CPU in one
+        # contiguous copy at epoch end.
+        self.all_preds.append(preds.detach())
+        self.all_labels.append(labels.detach())
 
     def log_iter_stats(self, cur_epoch, cur_iter, preds=[], labels=[]):
         """